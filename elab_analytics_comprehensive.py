@@ -4,23 +4,87 @@ Exports complete analytics data from Supabase with all requested analyses
 Fixes district naming inconsistencies and removes duplicates
 """
 
+import hashlib
+import io
 import os
+import sys
+import tempfile
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import pandas as pd
+import pyarrow as pa
 from supabase import create_client, Client
 from dotenv import load_dotenv
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
 import json
+import logging
+from logging.handlers import MemoryHandler
 
 # Load environment variables
 load_dotenv()
 
+# Progress messages; main() attaches a buffered stdout handler
+logger = logging.getLogger(__name__)
+
+# PostgREST returns at most this many rows per request; larger tables are paged
+PAGE_SIZE = 1000
+# Concurrent page requests in flight per table
+MAX_FETCH_WORKERS = 8
+
+# Normalized users/visits/tests frames are kept on disk as Parquet and reused while fresh
+PARQUET_CACHE_DIR = '.cache'
+PARQUET_CACHE_TTL = timedelta(hours=1)
+
+# Rows converted to Python values at a time while streaming a sheet to Excel
+EXCEL_CHUNK_ROWS = 10_000
+# Rows sampled to size non-categorical columns (categorical widths come from the categories themselves)
+EXCEL_WIDTH_SAMPLE_ROWS = 200
+# Number format of datetime columns; their width comes from this, since every cell renders at its full length
+EXCEL_DATETIME_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+
+# Columns fetched once per export and shared by every analysis
+USERS_COLUMNS = 'id, name, role'
+VISITS_COLUMNS = (
+    'id, visit_date, owner_id, total_amount, payment_status, sample_collected, report_sent, '
+    'lab_assistant_id, field_staff_id, field_staff_name, owners(id, district, state)'
+)
+TESTS_COLUMNS = 'test_type, test_name, price, created_at, visit_animal_id'
+VISIT_ANIMALS_COLUMNS = 'id, visit_id, animal_id'
+ANIMALS_COLUMNS = 'id, species, breed'
+
+# Arrow type of every fetched column (embedded columns by their flattened name), so the JSON values never pick it:
+# whole-rupee amounts arrive as ints and a column that is null on every row would otherwise be typed null.
+# visit_date and created_at stay strings for the loaders' pandas ISO8601 parse
+FETCH_TYPES = {
+    **{column: pa.string() for column in [
+        'id', 'name', 'role', 'visit_date', 'owner_id', 'lab_assistant_id', 'field_staff_id', 'field_staff_name',
+        'owners_id', 'owners_district', 'owners_state', 'test_type', 'test_name', 'created_at', 'visit_animal_id',
+        'visit_id', 'animal_id', 'species', 'breed'
+    ]},
+    **{column: pa.bool_() for column in ['payment_status', 'sample_collected', 'report_sent']},
+    'total_amount': pa.float64(),
+    'price': pa.float64(),
+}
+
+# Output column names for the price aggregations in the test summaries
+TEST_AGG_COLUMNS = {'count': 'test_count', 'sum': 'total_revenue', 'mean': 'avg_price'}
+
+# Low-cardinality grouping keys stored as category dtype so groupbys hash integer codes
+CATEGORY_COLUMNS = [
+    'district', 'state', 'test_type', 'test_name', 'species', 'employee_name', 'employee_role', 'year_month', 'month_name'
+]
+
+# Flattened visits layout built from the payload above (embedded keys are joined with '_')
+VISITS_FRAME_COLUMNS = [
+    'id', 'visit_date', 'owner_id', 'total_amount', 'payment_status', 'sample_collected', 'report_sent',
+    'lab_assistant_id', 'field_staff_id', 'field_staff_name', 'district', 'state'
+]
+
 class eLABAnalyticsComprehensive:
-    def __init__(self):
-        """Initialize Supabase client"""
+    def __init__(self, refresh: bool = False):
+        """Initialize Supabase client (refresh=True ignores the on-disk Parquet cache)"""
         supabase_url = os.getenv("SUPABASE_URL")
         supabase_key = os.getenv("SUPABASE_KEY")
 
@@ -28,7 +92,15 @@ class eLABAnalyticsComprehensive:
             raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in .env file")
 
         self.client: Client = create_client(supabase_url, supabase_key)
-        print("✓ Connected to Supabase")
+        logger.info("✓ Connected to Supabase")
+
+        # Supabase payloads and normalized DataFrames, reused across analyses within one export, as
+        # (fetched at, value); export_to_excel starts empty and direct get_* calls re-fetch after PARQUET_CACHE_TTL
+        self._cache = {}
+        # One lock per cache key, so concurrent loaders wait for an in-flight fetch instead of repeating it
+        self._cache_locks = {}
+        self._cache_locks_guard = threading.Lock()
+        self.refresh = refresh
 
         # District name normalization mapping
         self.district_mapping = {
@@ -57,20 +129,53 @@ class eLABAnalyticsComprehensive:
             'wayanad': 'Wayanad',
             'pathanamthitta': 'Pathanamthitta',
         }
+        # Already-standard names skip the lower()/lookup step
+        self.canonical_districts = set(self.district_mapping.values())
 
     def normalize_district(self, district: str) -> str:
-        """Normalize district names to standard format"""
-        if not district or pd.isna(district):
+        """Normalize district names to standard format (single-value counterpart of normalize_districts)"""
+        if district is None or pd.isna(district) or str(district) == '':
             return 'Unknown'
-        district_lower = str(district).strip().lower()
-        return self.district_mapping.get(district_lower, district.strip())
+        stripped = str(district).strip()
+        if stripped in self.canonical_districts:
+            return stripped
+        return self.district_mapping.get(stripped.lower(), stripped)
+
+    def normalize_districts(self, districts: pd.Series) -> pd.Series:
+        """Normalize a whole column of district names (vectorized normalize_district)"""
+        raw = districts.fillna('').astype(str)
+        stripped = raw.str.strip()
+        # Only non-canonical names need lowercasing and a mapping lookup
+        needs_lookup = ~stripped.isin(self.canonical_districts)
+        other = stripped[needs_lookup]
+        normalized = stripped.mask(needs_lookup, other.str.lower().map(self.district_mapping).fillna(other))
+        return normalized.where(raw != '', 'Unknown')
 
     def get_date_range(self, days_back: int = 365) -> tuple:
-        """Get date range for queries (default: all time if days_back is large)"""
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days_back)
+        """
+        Get date range for queries (default: all time if days_back is large)
+        The range covers whole days, from midnight days_back days ago to the end of today, so repeat
+        exports on the same day ask for the same range and reuse its Parquet caches
+        """
+        end_date = datetime.now().replace(hour=23, minute=59, second=59, microsecond=999999)
+        start_date = (end_date - timedelta(days=days_back)).replace(hour=0, minute=0, second=0, microsecond=0)
         return start_date.isoformat(), end_date.isoformat()
 
+    def add_period_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Derive year, year_month ('2025-03') and month_name ('March 2025') from a parsed visit_date column
+        Rows are keyed by the integer year*100+month and the labels are formatted once per distinct month
+        """
+        dates = df['visit_date']
+        df['year'] = dates.dt.year
+        codes, months = pd.factorize(dates.dt.year * 100 + dates.dt.month, sort=True)
+        months = months.astype(int)
+        firsts = pd.to_datetime(pd.DataFrame({'year': months // 100, 'month': months % 100, 'day': 1}))
+        df['year_month'] = pd.Categorical.from_codes(codes, firsts.dt.strftime('%Y-%m'))
+        month_names = firsts.dt.strftime('%B %Y')
+        df['month_name'] = pd.Categorical.from_codes(codes, month_names).reorder_categories(sorted(month_names))
+        return df
+
     def get_employee_id(self, visit_data: dict) -> tuple:
         """
         Get the correct employee ID and name from visit data.
@@ -90,787 +195,932 @@ class eLABAnalyticsComprehensive:
 
         return employee_id, employee_name, employee_role
 
-    # ========== DISTRICT-WISE ANALYSIS WITH FIXES ==========
-    def get_district_analysis_comprehensive(self, start_date: str, end_date: str) -> pd.DataFrame:
+    def categorize(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Convert the CATEGORY_COLUMNS present in df to category dtype"""
+        for column in CATEGORY_COLUMNS:
+            if column in df.columns:
+                df[column] = df[column].astype('category')
+        return df
+
+    def lookup_by_id(self, keys: pd.Series, by_id: pd.DataFrame) -> Tuple[pd.DataFrame, pd.Series]:
         """
-        Comprehensive district-wise analysis with normalized names
-        Gets ALL records without date filtering to ensure we get all 5588+ visits
+        Rows of an id-indexed frame for each key, aligned to keys' index, plus a mask of the keys found
+        Looks keys up on the frame's index rather than merging, so a cached frame's hash table is reused
         """
-        print("📊 Fetching comprehensive district-wise analysis...")
+        found = pd.Series(by_id.index.get_indexer(keys) >= 0, index=keys.index)
+        return by_id.reindex(keys).set_axis(keys.index), found
 
-        # Get ALL visits without date filtering
-        visits = self.client.table('visits').select(
-            'id, visit_date, owner_id, total_amount, owners(district, state)'
-        ).execute()
+    def lookup_users(self, employee_id: pd.Series, users: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        """
+        user_name, user_role and is_user for each employee_id, aligned to employee_id's index
+        Uses the cached id-indexed users table unless a users frame is given
+        """
+        by_id = self._users_by_id() if users is None else users.set_index('id')
+        matched, is_user = self.lookup_by_id(employee_id, by_id[['name', 'role']])
+        return pd.DataFrame({
+            'user_name': matched['name'],
+            'user_role': matched['role'],
+            'is_user': is_user
+        }, copy=False)
+
+    # ========== DATA LOADING & CACHING ==========
+    def _fetch_cached(self, key: tuple, fn):
+        """
+        Return the cached value for key, calling fn() on the first request and again once the entry is
+        older than PARQUET_CACHE_TTL, so a long-lived instance never serves data staler than the Parquet cache
+        DataFrames are handed out as shallow copies so a caller adding columns cannot alter the cached frame
+        Safe to call from several threads: only the first caller for a key runs fn(), the rest wait for it
+        """
+        with self._cache_locks_guard:
+            lock = self._cache_locks.setdefault(key, threading.Lock())
+        with lock:
+            entry = self._cache.get(key)
+            if entry is None or time.monotonic() - entry[0] >= PARQUET_CACHE_TTL.total_seconds():
+                # Stamped before the fetch starts, so the entry's age covers the whole fetch
+                fetched_at = time.monotonic()
+                entry = self._cache[key] = (fetched_at, fn())
+            value = entry[1]
+        return value.copy(deep=False) if isinstance(value, pd.DataFrame) else value
+
+    def invalidate(self):
+        """Drop every in-memory cached payload and DataFrame so the next request re-fetches"""
+        with self._cache_locks_guard:
+            self._cache.clear()
+            self._cache_locks.clear()
+
+    def _parquet_path(self, name: str) -> str:
+        """Location of the on-disk Parquet cache for a frame"""
+        return os.path.join(PARQUET_CACHE_DIR, f"{name}.parquet")
+
+    def _parquet_is_fresh(self, name: str) -> bool:
+        """True when the frame's Parquet cache exists, is younger than the TTL and refresh is off"""
+        path = self._parquet_path(name)
+        if self.refresh or not os.path.exists(path):
+            return False
+        return time.time() - os.path.getmtime(path) < PARQUET_CACHE_TTL.total_seconds()
+
+    def _persisted(self, name: str, build) -> pd.DataFrame:
+        """
+        Read the frame from its Parquet cache when fresh, otherwise build() it and save the result
+        The file is written under a temporary name and renamed into place, so an interrupted write never
+        leaves a partial cache; an unreadable cache file is rebuilt
+        """
+        path = self._parquet_path(name)
+        if self._parquet_is_fresh(name):
+            try:
+                df = pd.read_parquet(path)
+                logger.info(f"   ♻️ Using cached {name} from {path}")
+                return df
+            except (OSError, pa.ArrowException) as e:
+                logger.warning(f"   ⚠ Ignoring unreadable cache {path}: {e}")
+
+        df = build()
+        tmp_path = None
+        try:
+            os.makedirs(PARQUET_CACHE_DIR, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=PARQUET_CACHE_DIR, prefix=f"{name}.", suffix='.tmp')
+            os.close(fd)
+            df.to_parquet(tmp_path, index=False, compression='zstd')
+            os.replace(tmp_path, path)
+        except (OSError, pa.ArrowException) as e:
+            logger.warning(f"   ⚠ Could not write cache {path}: {e}")
+        finally:
+            # Left behind only when the write failed or was interrupted
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return df
 
-        print(f"   Retrieved {len(visits.data)} visit records")
+    def _range_cache_name(self, name: str, start_date: Optional[str], end_date: Optional[str]) -> str:
+        """
+        Parquet cache name for a frame covering a date range, e.g. visits_2024-11-20_2025-11-20_<hash>
+        The days keep the name readable; the hash of the exact bounds keeps ranges within the same days apart
+        """
+        if not (start_date or end_date):
+            return name
+        bounds = hashlib.sha256(f"{start_date}|{end_date}".encode()).hexdigest()[:12]
+        return f"{name}_{(start_date or 'start')[:10]}_{(end_date or 'end')[:10]}_{bounds}"
+
+    def _cached_result(self, name: str, start_date: str, end_date: str, fn) -> pd.DataFrame:
+        """An analysis result persisted to Parquet per (name, start date, end date)"""
+        return self._persisted(self._range_cache_name(name, start_date, end_date), fn)
+
+    def _date_filters(self, column: str, start_date: Optional[str], end_date: Optional[str]) -> Tuple[Tuple[str, str, Any], ...]:
+        """PostgREST (column, operator, value) filters restricting column to the date range"""
+        filters = []
+        if start_date:
+            filters.append((column, 'gte', start_date))
+        if end_date:
+            filters.append((column, 'lte', end_date))
+        return tuple(filters)
+
+    def _query(self, table: str, columns: str, filters: Tuple[Tuple[str, str, Any], ...] = (), count: Optional[str] = None):
+        """Supabase select on table with the (column, operator, value) filters applied"""
+        query = self.client.table(table).select(columns, count=count)
+        for column, operator, value in filters:
+            query = getattr(query, operator)(column, value)
+        return query
+
+    def _paginate(self, table: str, columns: str, filters: Tuple[Tuple[str, str, Any], ...] = (),
+                  page: int = PAGE_SIZE) -> List[Dict[str, Any]]:
+        """
+        Fetch every matching row of a table with ranged requests
+        Filters are applied server-side. The first page is requested with count='exact', and the remaining
+        pages are requested concurrently, stepping by the number of rows the server actually returned
+        (a project "Max rows" setting below page shortens every page)
+        """
+        def fetch_page(offset: int, size: int) -> List[Dict[str, Any]]:
+            return self._query(table, columns, filters).order('id').range(offset, offset + size - 1).execute().data
+
+        first = self._query(table, columns, filters, count='exact').order('id').range(0, page - 1).execute()
+        total = first.count or 0
+        stride = len(first.data)
+        pages = [first.data]
+        if stride:
+            with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as executor:
+                pages.extend(executor.map(lambda offset: fetch_page(offset, stride), range(stride, total, stride)))
+
+            # Rows inserted after the count spill past the last planned page
+            while len(pages[-1]) == stride:
+                pages.append(fetch_page(len(pages) * stride, stride))
+        rows = [row for data in pages for row in data]
+
+        if len(rows) < total:
+            logger.error(f"   ✗ {table}: fetched {len(rows)} of {total} rows; results will be incomplete")
+        return rows
+
+    def _select(self, table: str, columns: str, filters: Tuple[Tuple[str, str, Any], ...] = ()) -> pa.Table:
+        """
+        Fetch all matching rows from a Supabase table once per export, keyed on (table, columns, filters)
+        The rows are converted to a single Arrow table as soon as they arrive, so the per-row dicts are not kept
+        Embedded objects are flattened into parent_child columns, e.g. owners.district -> owners_district,
+        and every column is cast to its FETCH_TYPES type once here so no analysis has to coerce them
+        """
+        def fetch() -> pa.Table:
+            arrow = pa.Table.from_pylist(self._paginate(table, columns, filters))
+            while any(pa.types.is_struct(field.type) for field in arrow.schema):
+                arrow = arrow.flatten()
+            arrow = arrow.rename_columns([name.replace('.', '_') for name in arrow.column_names])
+            # A column missing from FETCH_TYPES that is null on every row becomes string, never null[pyarrow]
+            schema = pa.schema([
+                field.with_type(FETCH_TYPES.get(field.name, pa.string() if pa.types.is_null(field.type) else field.type))
+                for field in arrow.schema
+            ])
+            return arrow.cast(schema)
+        return self._fetch_cached((table, columns, filters), fetch)
+
+    def _frame(self, arrow: pa.Table) -> pd.DataFrame:
+        """Arrow-backed pandas view of a fetched table"""
+        return arrow.to_pandas(types_mapper=pd.ArrowDtype)
+
+    def _load_users(self) -> pd.DataFrame:
+        """All users as a DataFrame"""
+        def build():
+            users = self._frame(self._select('users', USERS_COLUMNS))
+            return users.reindex(columns=['id', 'name', 'role'])
+        return self._fetch_cached(('users_df',), lambda: self._persisted('users', build))
+
+    def _users_by_id(self) -> pd.DataFrame:
+        """Users indexed by id, built once per export for lookup_users"""
+        return self._fetch_cached(('users_by_id',), lambda: self._load_users().set_index('id'))
+
+    def _load_visits(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> pd.DataFrame:
+        """
+        Visits in the date range (filtered server-side) flattened with owner district/state
+        visit_date is parsed and district is normalized once for every analysis
+        """
+        def build():
+            filters = self._date_filters('visit_date', start_date, end_date)
+            df = self._frame(self._select('visits', VISITS_COLUMNS, filters))
+            df = df.rename(columns={'owners_district': 'district', 'owners_state': 'state'})
+            df = df.reindex(columns=VISITS_FRAME_COLUMNS + ['owners_id'])
+
+            df['visit_date'] = pd.to_datetime(df['visit_date'], utc=True, format='ISO8601')
+            self.add_period_columns(df)
+            df['district'] = self.normalize_districts(df['district'])
+            # Visits without an owner default to Kerala
+            df['state'] = df['state'].where(df['owners_id'].notna(), 'Kerala')
+            return self.categorize(df.drop(columns='owners_id'))
+        cache_name = self._range_cache_name('visits', start_date, end_date)
+        return self._fetch_cached(('visits_df', start_date, end_date), lambda: self._persisted(cache_name, build))
+
+    def _load_visit_ids(self) -> pd.Series:
+        """Ids of every visit regardless of date, to tell a link to an out-of-range visit from a dangling one"""
+        def build():
+            return self._frame(self._select('visits', 'id')).reindex(columns=['id'])
+        return self._fetch_cached(('visit_ids_df',), lambda: self._persisted('visit_ids', build))['id']
+
+    def _load_visit_animals(self) -> pd.DataFrame:
+        """All visit_animals links (visit <-> animal), shared by the tests join and the species analysis"""
+        def build():
+            return self._frame(self._select('visit_animals', VISIT_ANIMALS_COLUMNS)).reindex(columns=['id', 'visit_id', 'animal_id'])
+        return self._fetch_cached(('visit_animals_df',), lambda: self._persisted('visit_animals', build))
+
+    def _load_animals(self) -> pd.DataFrame:
+        """All animals with their species and breed"""
+        def build():
+            return self._frame(self._select('animals', ANIMALS_COLUMNS)).reindex(columns=['id', 'species', 'breed'])
+        return self._fetch_cached(('animals_df',), lambda: self._persisted('animals', build))
+
+    def _animals_by_id(self) -> pd.DataFrame:
+        """Animals indexed by id, built once per export for the species lookup"""
+        return self._fetch_cached(('animals_by_id',), lambda: self._load_animals().set_index('id'))
+
+    def _visit_links(self, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                     visits: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        """
+        visit_animals links left-joined with the visits in the date range (or the given visits frame)
+        Built once per range and shared by the tests join and the species analysis; visit_match is 'both'
+        for links whose visit is in the frame
+        """
+        def build():
+            frame = self._load_visits(start_date, end_date) if visits is None else visits
+            return self._load_visit_animals().merge(
+                frame[[
+                    'id', 'visit_date', 'total_amount', 'lab_assistant_id', 'field_staff_id', 'field_staff_name',
+                    'district', 'state'
+                ]].rename(columns={'id': 'visit_id'}),
+                on='visit_id', how='left', indicator='visit_match'
+            )
+        if visits is not None:
+            return build()
+        return self._fetch_cached(('visit_links', start_date, end_date), build)
 
-        data = []
-        for visit in visits.data:
-            owner_data = visit.get('owners', {}) or {}
-            district = self.normalize_district(owner_data.get('district', 'Unknown'))
+    def _load_tests(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> pd.DataFrame:
+        """
+        Tests joined with their visit, employee and owner details
+        Tests are fetched flat and merged onto the shared visit links for the date range, so only
+        visits in range (plus every visit id) are fetched; tests on visits outside the range are dropped
+        visit_date falls back to the test's created_at when it has no visit
+        """
+        def build():
+            tests = self._frame(self._select('tests', TESTS_COLUMNS)).reindex(columns=[
+                'test_type', 'test_name', 'price', 'created_at', 'visit_animal_id'
+            ])
+            links = self._visit_links(start_date, end_date).drop(columns=['animal_id', 'total_amount'])
+            raw = tests.merge(links.rename(columns={'id': 'visit_animal_id'}), on='visit_animal_id', how='left')
+            has_visit = raw['visit_match'].eq('both')
+            if start_date or end_date:
+                # A linked visit missing from the range frame is dated outside the range, unless no such
+                # visit exists at all: those tests fall back to created_at like tests without a visit
+                no_visit = raw['visit_id'].isna() | ~raw['visit_id'].isin(self._load_visit_ids())
+                in_range = has_visit | no_visit
+                raw, has_visit = raw[in_range], has_visit[in_range]
+
+            df = pd.DataFrame({
+                'test_type': raw['test_type'],
+                'test_name': raw['test_name'],
+                'price': raw['price'].fillna(0),
+                'visit_date': raw['visit_date'].where(
+                    has_visit, pd.to_datetime(raw['created_at'], utc=True, format='ISO8601')
+                ),
+                'lab_assistant_id': raw['lab_assistant_id'],
+                'field_staff_id': raw['field_staff_id'],
+                'field_staff_name': raw['field_staff_name'].where(has_visit, 'Unknown'),
+                'district': raw['district'].astype(object).where(has_visit, 'Unknown'),
+                'state': raw['state'].astype(object).where(has_visit, 'Kerala')
+            }, copy=False)
+            # Tests with neither a visit date nor created_at can't be placed in time
+            df = df[df['visit_date'].notna()].reset_index(drop=True)
+            return self.categorize(self.add_period_columns(df))
+        cache_name = self._range_cache_name('tests', start_date, end_date)
+        return self._fetch_cached(('tests_df', start_date, end_date), lambda: self._persisted(cache_name, build))
 
-            data.append({
-                'district': district,
-                'state': owner_data.get('state', 'Kerala'),
-                'visit_id': visit['id'],
-                'visit_date': visit['visit_date'],
-                'owner_id': visit.get('owner_id'),
-                'total_amount': visit.get('total_amount', 0) or 0
-            })
+    # ========== DISTRICT-WISE ANALYSIS WITH FIXES ==========
+    def get_district_analysis_comprehensive(self, start_date: str, end_date: str,
+                                            df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        """
+        Comprehensive district-wise analysis with normalized names
+        Pages through every visit in the range so none of the 5588+ visits are dropped
+        """
+        logger.info("📊 Fetching comprehensive district-wise analysis...")
+
+        if df is None:
+            df = self._load_visits(start_date, end_date)
+
+        logger.info(f"   Retrieved {len(df)} visit records")
 
-        df = pd.DataFrame(data)
         if len(df) > 0:
-            df['visit_date'] = pd.to_datetime(df['visit_date'])
-            # Apply date filtering AFTER retrieving all data
-            if start_date and end_date:
-                df = df[(df['visit_date'] >= start_date) & (df['visit_date'] <= end_date)]
-
-            summary = df.groupby(['district', 'state']).agg({
-                'visit_id': 'count',
-                'owner_id': 'nunique',
-                'total_amount': ['sum', 'mean']
-            }).reset_index()
-            summary.columns = ['district', 'state', 'total_cases', 'unique_owners', 'total_revenue', 'avg_revenue_per_visit']
-            summary = summary.sort_values('total_cases', ascending=False)
+            df = df.assign(total_amount=df['total_amount'].fillna(0))
+
+            summary = df.groupby(['district', 'state'], sort=False, observed=True, as_index=False).agg(
+                total_cases=('id', 'count'),
+                unique_owners=('owner_id', 'nunique'),
+                total_revenue=('total_amount', 'sum'),
+                avg_revenue_per_visit=('total_amount', 'mean')
+            )
+            summary = summary.sort_values(['total_cases', 'district', 'state'], ascending=[False, True, True])
             return summary
         return df
 
     # ========== MONTHLY EMPLOYEE COMPARISON ==========
-    def get_employee_monthly_comparison(self, start_date: str, end_date: str) -> pd.DataFrame:
+    def get_employee_monthly_comparison(self, start_date: str, end_date: str,
+                                        df: Optional[pd.DataFrame] = None,
+                                        users_df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         """
         Monthly comparison of individual employees - cases, revenue, performance
         Uses field_staff_id first (the actual employee), fallback to lab_assistant_id
+        df, when given, must already be the visits in the date range
         """
-        print("👥 Fetching monthly employee comparison...")
-
-        # Get users data separately
-        users = self.client.table('users').select('id, name, email, role').execute()
-        users_dict = {u['id']: u for u in users.data}
-
-        # Get ALL visits
-        visits = self.client.table('visits').select(
-            'id, visit_date, lab_assistant_id, total_amount, payment_status, sample_collected, report_sent, field_staff_id, field_staff_name'
-        ).execute()
-
-        print(f"   Retrieved {len(visits.data)} visit records")
-
-        data = []
-        for visit in visits.data:
-            # CORRECT LOGIC: field_staff_id is the actual employee who added the case
-            employee_id, employee_name, employee_role = self.get_employee_id(visit)
-
-            # If we have employee_id from field_staff_id but no name, try to get from users table
-            if employee_id and not employee_name:
-                user_data = users_dict.get(employee_id, {})
-                employee_name = user_data.get('name', 'Unknown')
-                if user_data.get('role'):
-                    employee_role = user_data.get('role')
-
-            # Skip if no employee ID at all
-            if not employee_id:
-                continue
-
-            visit_date = pd.to_datetime(visit['visit_date'])
-
-            data.append({
-                'employee_id': employee_id,
-                'employee_name': employee_name or 'Unknown',
-                'employee_role': employee_role,
-                'year_month': visit_date.strftime('%Y-%m'),
-                'month_name': visit_date.strftime('%B %Y'),
-                'visit_id': visit['id'],
-                'revenue': visit.get('total_amount', 0) or 0,
-                'payment_received': 1 if visit.get('payment_status') else 0,
-                'sample_collected': 1 if visit.get('sample_collected') else 0,
-                'report_sent': 1 if visit.get('report_sent') else 0
-            })
-
-        df = pd.DataFrame(data)
-        if len(df) > 0:
-            # Apply date filtering after retrieval
-            df['visit_date_parsed'] = pd.to_datetime(df['year_month'] + '-01')
-            if start_date and end_date:
-                start_dt = pd.to_datetime(start_date)
-                end_dt = pd.to_datetime(end_date)
-                df = df[(df['visit_date_parsed'] >= start_dt) & (df['visit_date_parsed'] <= end_dt)]
-
-            monthly_summary = df.groupby(['employee_id', 'employee_name', 'employee_role', 'year_month', 'month_name']).agg({
-                'visit_id': 'count',
-                'revenue': 'sum',
-                'payment_received': 'sum',
-                'sample_collected': 'sum',
-                'report_sent': 'sum'
-            }).reset_index()
-            monthly_summary.columns = ['employee_id', 'employee_name', 'employee_role', 'year_month', 'month_name',
-                                       'total_cases', 'total_revenue', 'payments_received', 'samples_collected', 'reports_sent']
-            monthly_summary = monthly_summary.sort_values(['year_month', 'total_cases'], ascending=[True, False])
+        logger.info("👥 Fetching monthly employee comparison...")
+
+        visits = self._load_visits(start_date, end_date) if df is None else df
+
+        logger.info(f"   Retrieved {len(visits)} visit records")
+
+        # CORRECT LOGIC: field_staff_id is the actual employee who added the case
+        has_field_staff = visits['field_staff_id'].notna()
+        employee_id = visits['field_staff_id'].where(has_field_staff, visits['lab_assistant_id'])
+
+        # Skip if no employee ID at all, before deriving the remaining columns so they are only built
+        # for the rows that are kept (the visits are already limited to the range server-side)
+        keep = employee_id.notna()
+        visits, employee_id, has_field_staff = visits[keep], employee_id[keep], has_field_staff[keep]
+
+        employee_role = pd.Series('field_staff', index=visits.index).where(has_field_staff, 'lab_assistant')
+        employee_name = visits['field_staff_name']
+
+        # If we have employee_id from field_staff_id but no name, try to get from users table
+        missing_name = employee_name.fillna('').eq('')
+        user = self.lookup_users(employee_id, users_df)
+        employee_name = employee_name.mask(missing_name, user['user_name'])
+        user_role = user['user_role']
+        employee_role = employee_role.mask(missing_name & user_role.notna(), user_role)
+
+        if len(visits) > 0:
+            # Group the measures straight on the derived key series; no per-visit employee frame is built
+            keys = [
+                employee_id.rename('employee_id'),
+                employee_name.fillna('Unknown').astype('category').rename('employee_name'),
+                employee_role.astype('category').rename('employee_role'),
+                visits['year_month'],
+                visits['month_name']
+            ]
+            measures = pd.DataFrame({
+                'visit_id': visits['id'],
+                'revenue': visits['total_amount'].fillna(0),
+                'payment_received': visits['payment_status'].fillna(False).astype(bool),
+                'sample_collected': visits['sample_collected'].fillna(False).astype(bool),
+                'report_sent': visits['report_sent'].fillna(False).astype(bool)
+            }, copy=False)
+            # Keys are series rather than columns, so they come back as the index (as_index=False would drop them)
+            monthly_summary = measures.groupby(keys, sort=False, observed=True).agg(
+                total_cases=('visit_id', 'count'),
+                total_revenue=('revenue', 'sum'),
+                payments_received=('payment_received', 'sum'),
+                samples_collected=('sample_collected', 'sum'),
+                reports_sent=('report_sent', 'sum')
+            ).reset_index()
+            monthly_summary = monthly_summary.sort_values(
+                ['year_month', 'total_cases', 'employee_id', 'employee_name', 'employee_role', 'month_name'],
+                ascending=[True, False, True, True, True, True]
+            )
             return monthly_summary
-        return df
+        return pd.DataFrame(columns=[
+            'employee_id', 'employee_name', 'employee_role', 'year_month', 'month_name',
+            'total_cases', 'total_revenue', 'payments_received', 'samples_collected', 'reports_sent'
+        ])
 
     # ========== MONTHLY CASES BY INDIVIDUAL EMPLOYEES ==========
-    def get_employee_monthly_cases(self, start_date: str, end_date: str) -> pd.DataFrame:
+    def get_employee_monthly_cases(self, start_date: str, end_date: str,
+                                   df: Optional[pd.DataFrame] = None,
+                                   users_df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         """
         Monthly cases done by each individual employee with details
         """
-        print("📅 Fetching monthly cases by individual employees...")
-
-        # Get users data separately
-        users = self.client.table('users').select('id, name, role').execute()
-        users_dict = {u['id']: u for u in users.data}
-
-        visits = self.client.table('visits').select(
-            'id, visit_date, lab_assistant_id, total_amount, field_staff_id, field_staff_name, owner_id, owners(district, state)'
-        ).gte('visit_date', start_date).lte('visit_date', end_date).execute()
-
-        data = []
-        for visit in visits.data:
-            employee_id = visit.get('lab_assistant_id') or visit.get('field_staff_id')
-            user_data = users_dict.get(employee_id, {})
-            owner_data = visit.get('owners', {}) or {}
-            visit_date = pd.to_datetime(visit['visit_date'])
-
-            data.append({
-                'employee_id': employee_id,
-                'employee_name': user_data.get('name') or visit.get('field_staff_name', 'Unknown'),
-                'employee_role': user_data.get('role', 'field_staff'),
-                'year_month': visit_date.strftime('%Y-%m'),
-                'month_name': visit_date.strftime('%B %Y'),
-                'visit_date': visit['visit_date'],
-                'district': self.normalize_district(owner_data.get('district', 'Unknown')),
-                'state': owner_data.get('state', 'Kerala'),
-                'revenue': visit.get('total_amount', 0) or 0
-            })
+        logger.info("📅 Fetching monthly cases by individual employees...")
+
+        visits = self._load_visits(start_date, end_date) if df is None else df
+
+        employee_id = visits['lab_assistant_id'].fillna(visits['field_staff_id'])
+        user = self.lookup_users(employee_id, users_df)
+
+        df = pd.DataFrame({
+            'employee_id': employee_id,
+            'employee_name': user['user_name'].fillna(visits['field_staff_name']),
+            'employee_role': user['user_role'].where(user['is_user'], 'field_staff'),
+            'year_month': visits['year_month'],
+            'month_name': visits['month_name'],
+            'visit_date': visits['visit_date'].dt.tz_localize(None),
+            'district': visits['district'],
+            'state': visits['state'],
+            'revenue': visits['total_amount'].fillna(0)
+        }, copy=False)
 
-        df = pd.DataFrame(data)
         if len(df) > 0:
             df = df.sort_values(['employee_name', 'year_month', 'visit_date'])
             return df
         return df
 
-    # ========== TEST ANALYSIS WITH MONTHLY BREAKDOWN ==========
-    def get_test_monthly_analysis(self, start_date: str, end_date: str) -> pd.DataFrame:
+    # ========== SHARED TEST DATA ==========
+    def _tests_in_range(self, start_date: str, end_date: str) -> pd.DataFrame:
         """
-        Test analysis with monthly breakdown - which tests are done each month
+        Tests dated within the range with their employee resolved
+        Built once per date range and shared by every test analysis
         """
-        print("🔬 Fetching test analysis with monthly breakdown...")
-
-        # Get users data separately
-        users = self.client.table('users').select('id, name').execute()
-        users_dict = {u['id']: u for u in users.data}
-
-        tests = self.client.table('tests').select(
-            'id, test_type, test_name, price, created_at, visit_animal_id, visit_animals(visit_id, visits(visit_date, lab_assistant_id, field_staff_id, field_staff_name))'
-        ).execute()
+        def build():
+            tests = self._load_tests(start_date, end_date)
 
-        # Make start_date and end_date timezone-aware
-        start_dt = pd.to_datetime(start_date).tz_localize('UTC')
-        end_dt = pd.to_datetime(end_date).tz_localize('UTC')
+            # Make start_date and end_date timezone-aware
+            start_dt = pd.to_datetime(start_date).tz_localize('UTC')
+            end_dt = pd.to_datetime(end_date).tz_localize('UTC')
 
-        data = []
-        for test in tests.data:
-            va = test.get('visit_animals') or {}
-            visit = va.get('visits') or {}
+            # Filter by date range
+            tests = tests[(tests['visit_date'] >= start_dt) & (tests['visit_date'] <= end_dt)]
+
+            # The raw staff columns are only needed to resolve the employee, so they are not carried along
+            employee_id = tests['lab_assistant_id'].fillna(tests['field_staff_id'])
+            user = self.lookup_users(employee_id)
+            df = tests.drop(columns=['lab_assistant_id', 'field_staff_id', 'field_staff_name']).assign(
+                employee_id=employee_id,
+                employee_name=user['user_name'].fillna(tests['field_staff_name']),
+                employee_role=user['user_role'].where(user['is_user'], 'field_staff')
+            )
+            return self.categorize(df)
+        return self._fetch_cached(('tests_in_range', start_date, end_date), build)
 
-            visit_date_str = visit.get('visit_date') if visit else test.get('created_at')
-            if not visit_date_str:
-                continue
+    def _summarize_tests(self, df: pd.DataFrame, keys: List[str], aggs: List[str],
+                         sort_by: List[str], ascending: List[bool]) -> pd.DataFrame:
+        """
+        Group tests by keys and aggregate price, naming results test_count / total_revenue / avg_price
+        Groups are left unsorted; ties in sort_by are ordered by the remaining keys
+        """
+        summary = df.groupby(keys, sort=False, observed=True, as_index=False).agg(
+            **{TEST_AGG_COLUMNS[agg]: ('price', agg) for agg in aggs}
+        )
+        tie_breakers = [key for key in keys if key not in sort_by]
+        return summary.sort_values(sort_by + tie_breakers, ascending=ascending + [True] * len(tie_breakers))
 
-            visit_date = pd.to_datetime(visit_date_str)
+    # ========== TEST ANALYSIS WITH MONTHLY BREAKDOWN ==========
+    def get_test_monthly_analysis(self, start_date: str, end_date: str,
+                                  df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        """
+        Test analysis with monthly breakdown - which tests are done each month
+        """
+        logger.info("🔬 Fetching test analysis with monthly breakdown...")
 
-            # Filter by date range
-            if visit_date < start_dt or visit_date > end_dt:
-                continue
-
-            data.append({
-                'test_type': test.get('test_type', 'Unknown'),
-                'test_name': test.get('test_name', 'Unknown'),
-                'price': test.get('price', 0) or 0,
-                'year_month': visit_date.strftime('%Y-%m'),
-                'month_name': visit_date.strftime('%B %Y'),
-                'visit_date': visit_date_str
-            })
+        df = self._tests_in_range(start_date, end_date) if df is None else df
 
-        df = pd.DataFrame(data)
         if len(df) > 0:
-            monthly_test_summary = df.groupby(['year_month', 'month_name', 'test_type', 'test_name']).agg({
-                'price': ['count', 'sum', 'mean']
-            }).reset_index()
-            monthly_test_summary.columns = ['year_month', 'month_name', 'test_type', 'test_name', 'test_count', 'total_revenue', 'avg_price']
-            monthly_test_summary = monthly_test_summary.sort_values(['year_month', 'test_count'], ascending=[True, False])
-            return monthly_test_summary
+            return self._summarize_tests(df, ['year_month', 'month_name', 'test_type', 'test_name'], ['count', 'sum', 'mean'],
+                                         sort_by=['year_month', 'test_count'], ascending=[True, False])
         return df
 
     # ========== TEST ANALYSIS EMPLOYEE-WISE ==========
-    def get_test_employee_wise_analysis(self, start_date: str, end_date: str) -> pd.DataFrame:
+    def get_test_employee_wise_analysis(self, start_date: str, end_date: str,
+                                        df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         """
         Test analysis employee-wise - which employee does which tests and how many
         """
-        print("👨‍⚕️ Fetching employee-wise test analysis...")
-
-        # Get users data separately
-        users = self.client.table('users').select('id, name, role').execute()
-        users_dict = {u['id']: u for u in users.data}
+        logger.info("👨‍⚕️ Fetching employee-wise test analysis...")
 
-        tests = self.client.table('tests').select(
-            'id, test_type, test_name, price, created_at, visit_animal_id, visit_animals(visit_id, visits(visit_date, lab_assistant_id, field_staff_id, field_staff_name))'
-        ).execute()
+        df = self._tests_in_range(start_date, end_date) if df is None else df
 
-        # Make start_date and end_date timezone-aware
-        start_dt = pd.to_datetime(start_date).tz_localize('UTC')
-        end_dt = pd.to_datetime(end_date).tz_localize('UTC')
-
-        data = []
-        for test in tests.data:
-            va = test.get('visit_animals') or {}
-            visit = va.get('visits') or {}
-
-            visit_date_str = visit.get('visit_date') if visit else test.get('created_at')
-            if not visit_date_str:
-                continue
-
-            visit_date = pd.to_datetime(visit_date_str)
-
-            # Filter by date range
-            if visit_date < start_dt or visit_date > end_dt:
-                continue
-
-            employee_id = visit.get('lab_assistant_id') or visit.get('field_staff_id')
-            user_data = users_dict.get(employee_id, {})
-            employee_name = user_data.get('name') or visit.get('field_staff_name', 'Unknown')
-
-            data.append({
-                'employee_id': employee_id,
-                'employee_name': employee_name,
-                'employee_role': user_data.get('role', 'field_staff'),
-                'test_type': test.get('test_type', 'Unknown'),
-                'test_name': test.get('test_name', 'Unknown'),
-                'price': test.get('price', 0) or 0,
-                'year_month': visit_date.strftime('%Y-%m'),
-                'month_name': visit_date.strftime('%B %Y')
-            })
-
-        df = pd.DataFrame(data)
         if len(df) > 0:
-            employee_test_summary = df.groupby(['employee_id', 'employee_name', 'employee_role', 'test_type', 'test_name']).agg({
-                'price': ['count', 'sum']
-            }).reset_index()
-            employee_test_summary.columns = ['employee_id', 'employee_name', 'employee_role', 'test_type', 'test_name', 'test_count', 'total_revenue']
-            employee_test_summary = employee_test_summary.sort_values(['employee_name', 'test_count'], ascending=[True, False])
-            return employee_test_summary
+            return self._summarize_tests(df, ['employee_id', 'employee_name', 'employee_role', 'test_type', 'test_name'], ['count', 'sum'],
+                                         sort_by=['employee_name', 'test_count'], ascending=[True, False])
         return df
 
     # ========== MOST TESTS DONE BY EACH EMPLOYEE ==========
-    def get_employee_most_tests(self, start_date: str, end_date: str) -> pd.DataFrame:
+    def get_employee_most_tests(self, start_date: str, end_date: str,
+                                df: Optional[pd.DataFrame] = None,
+                                employee_test_df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         """
         Most tests done by each employee - ranked list
+        Reuses employee_test_df from get_test_employee_wise_analysis when given
         """
-        print("🏆 Fetching most tests done by each employee...")
+        logger.info("🏆 Fetching most tests done by each employee...")
 
         # Get the employee-wise test data
-        employee_test_df = self.get_test_employee_wise_analysis(start_date, end_date)
+        if employee_test_df is None:
+            employee_test_df = self.get_test_employee_wise_analysis(start_date, end_date, df=df)
 
         if len(employee_test_df) > 0:
             # Group by employee to get their top tests
-            most_tests = employee_test_df.groupby(['employee_id', 'employee_name', 'employee_role']).agg({
-                'test_count': 'sum',
-                'total_revenue': 'sum'
-            }).reset_index()
-            most_tests.columns = ['employee_id', 'employee_name', 'employee_role', 'total_tests_performed', 'total_revenue_from_tests']
-            most_tests = most_tests.sort_values('total_tests_performed', ascending=False)
-
-            # Also get the top test for each employee
-            top_test_per_employee = employee_test_df.loc[employee_test_df.groupby('employee_id')['test_count'].idxmax()]
-            top_test_per_employee = top_test_per_employee[['employee_id', 'test_type', 'test_name', 'test_count']]
-            top_test_per_employee.columns = ['employee_id', 'most_common_test_type', 'most_common_test_name', 'most_common_test_count']
-
-            # Merge
-            result = pd.merge(most_tests, top_test_per_employee, on='employee_id', how='left')
-            return result
+            keys = ['employee_id', 'employee_name', 'employee_role']
+            most_tests = employee_test_df.groupby(keys, sort=False, observed=True, as_index=False).agg(
+                total_tests_performed=('test_count', 'sum'),
+                total_revenue_from_tests=('total_revenue', 'sum')
+            )
+            most_tests = most_tests.sort_values(['total_tests_performed'] + keys, ascending=[False, True, True, True])
+
+            # Also get the top test for each employee (first row holding their highest test_count)
+            top_rows = employee_test_df.groupby('employee_id', sort=False)['test_count'].idxmax()
+            top_test_per_employee = employee_test_df.loc[top_rows].set_index('employee_id')
+
+            # Assign onto the employee-indexed totals instead of merging
+            result = most_tests.set_index('employee_id')
+            result['most_common_test_type'] = top_test_per_employee['test_type']
+            result['most_common_test_name'] = top_test_per_employee['test_name']
+            result['most_common_test_count'] = top_test_per_employee['test_count']
+            return result.reset_index()
         return employee_test_df
 
     # ========== DISTRICT-WISE TEST ANALYSIS ==========
-    def get_district_test_analysis(self, start_date: str, end_date: str) -> pd.DataFrame:
+    def get_district_test_analysis(self, start_date: str, end_date: str,
+                                   df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         """
         District-wise test analysis with monthly and yearly breakdown
         Tests sorted from least to most by district
         """
-        print("🗺️ Fetching district-wise test analysis...")
-
-        # Get all tests with visit and district information
-        tests = self.client.table('tests').select(
-            'id, test_type, test_name, price, created_at, visit_animal_id, visit_animals(visit_id, visits(visit_date, owner_id, owners(district, state)))'
-        ).execute()
+        logger.info("🗺️ Fetching district-wise test analysis...")
 
-        # Make start_date and end_date timezone-aware
-        start_dt = pd.to_datetime(start_date).tz_localize('UTC')
-        end_dt = pd.to_datetime(end_date).tz_localize('UTC')
+        df = self._tests_in_range(start_date, end_date) if df is None else df
 
-        data = []
-        for test in tests.data:
-            va = test.get('visit_animals') or {}
-            visit = va.get('visits') or {}
-            owner = visit.get('owners') or {}
-
-            visit_date_str = visit.get('visit_date') if visit else test.get('created_at')
-            if not visit_date_str:
-                continue
-
-            visit_date = pd.to_datetime(visit_date_str)
-
-            # Filter by date range
-            if visit_date < start_dt or visit_date > end_dt:
-                continue
-
-            district = self.normalize_district(owner.get('district', 'Unknown'))
-
-            data.append({
-                'district': district,
-                'state': owner.get('state', 'Kerala'),
-                'test_type': test.get('test_type', 'Unknown'),
-                'test_name': test.get('test_name', 'Unknown'),
-                'price': test.get('price', 0) or 0,
-                'year': visit_date.year,
-                'year_month': visit_date.strftime('%Y-%m'),
-                'month_name': visit_date.strftime('%B %Y')
-            })
-
-        df = pd.DataFrame(data)
         if len(df) > 0:
             # District + Test summary (sorted least to most)
-            district_test_summary = df.groupby(['district', 'state', 'test_type', 'test_name']).agg({
-                'price': ['count', 'sum']
-            }).reset_index()
-            district_test_summary.columns = ['district', 'state', 'test_type', 'test_name', 'test_count', 'total_revenue']
-            district_test_summary = district_test_summary.sort_values(['district', 'test_count'], ascending=[True, True])
-
-            return district_test_summary
+            return self._summarize_tests(df, ['district', 'state', 'test_type', 'test_name'], ['count', 'sum'],
+                                         sort_by=['district', 'test_count'], ascending=[True, True])
         return df
 
     # ========== DISTRICT-WISE TEST MONTHLY ANALYSIS ==========
-    def get_district_test_monthly_analysis(self, start_date: str, end_date: str) -> pd.DataFrame:
+    def get_district_test_monthly_analysis(self, start_date: str, end_date: str,
+                                           df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         """
         District-wise test analysis with monthly breakdown
         """
-        print("📊 Fetching district-wise test monthly analysis...")
-
-        tests = self.client.table('tests').select(
-            'id, test_type, test_name, price, created_at, visit_animal_id, visit_animals(visit_id, visits(visit_date, owner_id, owners(district, state)))'
-        ).execute()
+        logger.info("📊 Fetching district-wise test monthly analysis...")
 
-        # Make start_date and end_date timezone-aware
-        start_dt = pd.to_datetime(start_date).tz_localize('UTC')
-        end_dt = pd.to_datetime(end_date).tz_localize('UTC')
+        df = self._tests_in_range(start_date, end_date) if df is None else df
 
-        data = []
-        for test in tests.data:
-            va = test.get('visit_animals') or {}
-            visit = va.get('visits') or {}
-            owner = visit.get('owners') or {}
-
-            visit_date_str = visit.get('visit_date') if visit else test.get('created_at')
-            if not visit_date_str:
-                continue
-
-            visit_date = pd.to_datetime(visit_date_str)
-
-            # Filter by date range
-            if visit_date < start_dt or visit_date > end_dt:
-                continue
-
-            district = self.normalize_district(owner.get('district', 'Unknown'))
-
-            data.append({
-                'district': district,
-                'state': owner.get('state', 'Kerala'),
-                'test_type': test.get('test_type', 'Unknown'),
-                'test_name': test.get('test_name', 'Unknown'),
-                'price': test.get('price', 0) or 0,
-                'year_month': visit_date.strftime('%Y-%m'),
-                'month_name': visit_date.strftime('%B %Y')
-            })
-
-        df = pd.DataFrame(data)
         if len(df) > 0:
-            monthly_summary = df.groupby(['district', 'state', 'year_month', 'month_name', 'test_type', 'test_name']).agg({
-                'price': ['count', 'sum']
-            }).reset_index()
-            monthly_summary.columns = ['district', 'state', 'year_month', 'month_name', 'test_type', 'test_name', 'test_count', 'total_revenue']
-            monthly_summary = monthly_summary.sort_values(['district', 'year_month', 'test_count'], ascending=[True, True, False])
-
-            return monthly_summary
+            return self._summarize_tests(df, ['district', 'state', 'year_month', 'month_name', 'test_type', 'test_name'], ['count', 'sum'],
+                                         sort_by=['district', 'year_month', 'test_count'], ascending=[True, True, False])
         return df
 
     # ========== DISTRICT-WISE TEST YEARLY ANALYSIS ==========
-    def get_district_test_yearly_analysis(self, start_date: str, end_date: str) -> pd.DataFrame:
+    def get_district_test_yearly_analysis(self, start_date: str, end_date: str,
+                                          df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         """
         District-wise test analysis with yearly breakdown
         """
-        print("📈 Fetching district-wise test yearly analysis...")
-
-        tests = self.client.table('tests').select(
-            'id, test_type, test_name, price, created_at, visit_animal_id, visit_animals(visit_id, visits(visit_date, owner_id, owners(district, state)))'
-        ).execute()
+        logger.info("📈 Fetching district-wise test yearly analysis...")
 
-        # Make start_date and end_date timezone-aware
-        start_dt = pd.to_datetime(start_date).tz_localize('UTC')
-        end_dt = pd.to_datetime(end_date).tz_localize('UTC')
+        df = self._tests_in_range(start_date, end_date) if df is None else df
 
-        data = []
-        for test in tests.data:
-            va = test.get('visit_animals') or {}
-            visit = va.get('visits') or {}
-            owner = visit.get('owners') or {}
-
-            visit_date_str = visit.get('visit_date') if visit else test.get('created_at')
-            if not visit_date_str:
-                continue
-
-            visit_date = pd.to_datetime(visit_date_str)
-
-            # Filter by date range
-            if visit_date < start_dt or visit_date > end_dt:
-                continue
-
-            district = self.normalize_district(owner.get('district', 'Unknown'))
-
-            data.append({
-                'district': district,
-                'state': owner.get('state', 'Kerala'),
-                'test_type': test.get('test_type', 'Unknown'),
-                'test_name': test.get('test_name', 'Unknown'),
-                'price': test.get('price', 0) or 0,
-                'year': visit_date.year
-            })
-
-        df = pd.DataFrame(data)
         if len(df) > 0:
-            yearly_summary = df.groupby(['district', 'state', 'year', 'test_type', 'test_name']).agg({
-                'price': ['count', 'sum']
-            }).reset_index()
-            yearly_summary.columns = ['district', 'state', 'year', 'test_type', 'test_name', 'test_count', 'total_revenue']
-            yearly_summary = yearly_summary.sort_values(['district', 'year', 'test_count'], ascending=[True, True, False])
-
-            return yearly_summary
+            return self._summarize_tests(df, ['district', 'state', 'year', 'test_type', 'test_name'], ['count', 'sum'],
+                                         sort_by=['district', 'year', 'test_count'], ascending=[True, True, False])
         return df
 
     # ========== SPECIES ANALYSIS ==========
-    def get_species_analysis(self, start_date: str, end_date: str, species: Optional[str] = None) -> pd.DataFrame:
+    def get_species_analysis(self, start_date: str, end_date: str, species: Optional[str] = None,
+                             df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
         """
         Species-wise cases and revenue analysis
+        Reuses the shared visit links for the range, so no separate filtered query or visits join is needed
         """
-        print("🐾 Fetching species-wise analysis...")
-
-        # Get animals with visits
-        query = self.client.table('visit_animals').select(
-            'id, animal_id, visit_id, animals(species, breed), visits(visit_date, total_amount)'
-        ).execute()
+        logger.info("🐾 Fetching species-wise analysis...")
 
-        data = []
-        for va in query.data:
-            animal = va.get('animals') or {}
-            visit = va.get('visits') or {}
+        # Animals on visits in the range (visits without a date never fall in it)
+        links = self._visit_links(start_date, end_date, visits=df)
+        links = links.loc[links['visit_match'].eq('both'), ['animal_id', 'visit_date', 'total_amount']]
+        animals, has_animal = self.lookup_by_id(links['animal_id'], self._animals_by_id())
 
-            if not visit:
-                continue
+        df = pd.DataFrame({
+            'species': animals['species'].where(has_animal, 'Unknown'),
+            'breed': animals['breed'].where(has_animal, 'Unknown'),
+            'visit_date': links['visit_date'],
+            'revenue': links['total_amount'].fillna(0)
+        }, copy=False)
 
-            visit_date_str = visit.get('visit_date')
-            if not visit_date_str:
-                continue
-
-            data.append({
-                'species': animal.get('species', 'Unknown'),
-                'breed': animal.get('breed', 'Unknown'),
-                'visit_date': visit_date_str,
-                'revenue': visit.get('total_amount', 0) or 0
-            })
-
-        df = pd.DataFrame(data)
         if len(df) > 0:
-            df['visit_date'] = pd.to_datetime(df['visit_date'])
-            df = df[(df['visit_date'] >= start_date) & (df['visit_date'] <= end_date)]
-
             if species:
                 df = df[df['species'].str.lower() == species.lower()]
 
-            summary = df.groupby('species').agg({
-                'visit_date': 'count',
-                'revenue': ['sum', 'mean']
-            }).reset_index()
-            summary.columns = ['species', 'total_cases', 'total_revenue', 'avg_revenue_per_case']
-            summary = summary.sort_values('total_cases', ascending=False)
+            summary = self.categorize(df).groupby('species', sort=False, observed=True, as_index=False).agg(
+                total_cases=('visit_date', 'count'),
+                total_revenue=('revenue', 'sum'),
+                avg_revenue_per_case=('revenue', 'mean')
+            )
+            summary = summary.sort_values(['total_cases', 'species'], ascending=[False, True])
             return summary
         return df
 
     # ========== DASHBOARD KPIs ==========
-    def get_dashboard_kpis(self, start_date: str, end_date: str) -> Dict[str, Any]:
+    def get_dashboard_kpis(self, start_date: str, end_date: str,
+                           df: Optional[pd.DataFrame] = None,
+                           users_df: Optional[pd.DataFrame] = None) -> Dict[str, Any]:
         """
         Combined dashboard with all KPIs
         """
-        print("📊 Generating dashboard KPIs...")
+        logger.info("📊 Generating dashboard KPIs...")
 
         # Get overall visit stats
-        visits = self.client.table('visits').select(
-            'id, visit_date, total_amount, payment_status, sample_collected, report_sent, owner_id'
-        ).gte('visit_date', start_date).lte('visit_date', end_date).execute()
-
-        visits_df = pd.DataFrame(visits.data)
+        visits_df = self._load_visits(start_date, end_date) if df is None else df
 
+        total_cases = len(visits_df)
         kpis = {
-            'total_cases': len(visits_df),
-            'total_revenue': float(visits_df['total_amount'].sum()) if len(visits_df) > 0 and 'total_amount' in visits_df.columns else 0,
-            'avg_revenue_per_case': float(visits_df['total_amount'].mean()) if len(visits_df) > 0 and 'total_amount' in visits_df.columns else 0,
-            'payment_completion_rate': float((visits_df['payment_status'].sum() / len(visits_df) * 100)) if len(visits_df) > 0 and 'payment_status' in visits_df.columns else 0,
-            'sample_collection_rate': float((visits_df['sample_collected'].sum() / len(visits_df) * 100)) if len(visits_df) > 0 and 'sample_collected' in visits_df.columns else 0,
-            'report_sent_rate': float((visits_df['report_sent'].sum() / len(visits_df) * 100)) if len(visits_df) > 0 and 'report_sent' in visits_df.columns else 0,
+            'total_cases': total_cases,
+            'total_revenue': 0,
+            'avg_revenue_per_case': 0,
+            'payment_completion_rate': 0,
+            'sample_collection_rate': 0,
+            'report_sent_rate': 0,
         }
+        unique_customers = 0
+        if total_cases > 0:
+            # One aggregation over the KPI columns (missing columns count as zero)
+            stats = visits_df.reindex(
+                columns=['total_amount', 'payment_status', 'sample_collected', 'report_sent', 'owner_id']
+            ).agg({
+                'total_amount': ['sum', 'mean'],
+                'payment_status': 'sum',
+                'sample_collected': 'sum',
+                'report_sent': 'sum',
+                'owner_id': 'nunique'
+            })
+            # Arrow-backed columns reduce to pd.NA when every value is missing (e.g. no visit billed yet)
+            def number(value) -> float:
+                return 0.0 if pd.isna(value) else float(value)
+
+            sums = stats.loc['sum']
+            unique_customers = int(stats.loc['nunique', 'owner_id'])
+            kpis.update({
+                'total_revenue': number(sums['total_amount']),
+                'avg_revenue_per_case': number(stats.loc['mean', 'total_amount']),
+                'payment_completion_rate': number(sums['payment_status']) / total_cases * 100,
+                'sample_collection_rate': number(sums['sample_collected']) / total_cases * 100,
+                'report_sent_rate': number(sums['report_sent']) / total_cases * 100,
+            })
 
         # Get employee count
-        employees = self.client.table('users').select('id, role').in_('role', ['lab_assistant', 'field_staff']).execute()
-        kpis['total_employees'] = len(employees.data)
+        users = self._load_users() if users_df is None else users_df
+        employees = users[users['role'].isin(['lab_assistant', 'field_staff'])]
+        kpis['total_employees'] = len(employees)
 
-        # Get unique owners
-        unique_owners = visits_df['owner_id'].nunique() if len(visits_df) > 0 and 'owner_id' in visits_df.columns else 0
-        kpis['unique_customers'] = int(unique_owners)
+        # Unique owners, counted in the aggregation above
+        kpis['unique_customers'] = unique_customers
 
         return kpis
 
     # ========== Excel Export Functions ==========
-    def format_excel_sheet(self, worksheet, df: pd.DataFrame):
-        """Apply formatting to Excel worksheet"""
-        if len(df) == 0:
-            return
+    def create_excel_formats(self, workbook) -> Dict[str, Any]:
+        """Cell formats registered once per workbook and shared by every sheet"""
+        return {
+            'header': workbook.add_format({
+                'bold': True, 'font_color': '#FFFFFF', 'font_size': 11, 'bg_color': '#4472C4',
+                'align': 'center', 'valign': 'vcenter', 'border': 1
+            }),
+            'datetime': workbook.add_format({'num_format': EXCEL_DATETIME_FORMAT}),
+        }
 
+    def format_excel_sheet(self, worksheet, df: pd.DataFrame, formats: Dict[str, Any]):
+        """Write the styled header row and set each column's width and format once"""
         # Header formatting
-        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        header_font = Font(bold=True, color="FFFFFF", size=11)
-
-        for cell in worksheet[1]:
-            cell.fill = header_fill
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-
-        # Auto-adjust column widths
-        for idx, column in enumerate(df.columns, 1):
-            column_letter = get_column_letter(idx)
+        worksheet.write_row(0, 0, [str(column) for column in df.columns], formats['header'])
+
+        # Auto-adjust column widths without stringifying every cell: text keys are categorical, so their
+        # longest label is exact; dates are as wide as their number format; other columns are sized from
+        # the first rows. Data cells carry no format of their own and pick up the column's
+        sample = df.head(EXCEL_WIDTH_SAMPLE_ROWS)
+        for idx, column in enumerate(df.columns):
+            column_format = None
+            if pd.api.types.is_datetime64_any_dtype(df[column]):
+                column_format = formats['datetime']
+                value_width = len(EXCEL_DATETIME_FORMAT)
+            elif isinstance(df[column].dtype, pd.CategoricalDtype):
+                categories = df[column].cat.remove_unused_categories().cat.categories.to_series()
+                value_width = categories.astype('string').str.len().max()
+            else:
+                value_width = sample[column].astype('string').str.len().max()
             max_length = max(
-                df[column].astype(str).apply(len).max(),
+                0 if pd.isna(value_width) else int(value_width),
                 len(str(column))
             )
             adjusted_width = min(max_length + 2, 50)
-            worksheet.column_dimensions[column_letter].width = adjusted_width
-
-        # Add borders
-        thin_border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
+            worksheet.set_column(idx, idx, adjusted_width, column_format)
 
-        for row in worksheet.iter_rows(min_row=1, max_row=len(df)+1, min_col=1, max_col=len(df.columns)):
-            for cell in row:
-                cell.border = thin_border
+    def write_excel_sheet(self, writer: pd.ExcelWriter, sheet_name: str, df: pd.DataFrame,
+                          formats: Dict[str, Any]) -> int:
+        """
+        Write a DataFrame to a new formatted worksheet, one row at a time; returns the rows written.
+        constant_memory mode flushes each row once the next one starts, so cells
+        must be written in row order (DataFrame.to_excel writes column by column).
+        """
+        worksheet = writer.book.add_worksheet(sheet_name)
+        self.format_excel_sheet(worksheet, df, formats)
+
+        # Box cells into Python objects a chunk at a time so memory stays bounded on tall sheets
+        for start in range(0, len(df), EXCEL_CHUNK_ROWS):
+            chunk = df.iloc[start:start + EXCEL_CHUNK_ROWS]
+            values = chunk.astype(object).where(chunk.notna(), None)
+            for row_idx, row in enumerate(values.itertuples(index=False, name=None), start + 1):
+                worksheet.write_row(row_idx, 0, row)
+        return len(df)
+
+    def write_json_section(self, f, key: str, value: Any, first: bool):
+        """
+        Append one "key": value member to the JSON object open in f and flush it
+        DataFrames are encoded by pandas' to_json (records) instead of via per-row dicts; the member is
+        encoded before anything is written, so a value that fails to encode leaves the file valid
+        """
+        if isinstance(value, pd.DataFrame):
+            encoded = value.to_json(orient='records', date_format='iso', double_precision=15)
+        else:
+            encoded = json.dumps(value, default=str)
+        f.write(('\n' if first else ',\n') + f"  {json.dumps(key)}: " + encoded)
+        f.flush()
+
+    def write_parquet_section(self, directory: Optional[str], key: str, df: pd.DataFrame) -> Optional[str]:
+        """
+        Write one exported table as <directory>/<key>.parquet for consumers that read Arrow instead of JSON
+        Best-effort like the Parquet cache: a failed write is logged, its partial file removed, and None returned
+        """
+        if directory is None:
+            return None
+        path = os.path.join(directory, f"{key}.parquet")
+        try:
+            df.to_parquet(path, index=False, compression='zstd')
+        except (OSError, pa.ArrowException) as e:
+            logger.warning(f"   ⚠ Could not write {path}: {e}")
+            if os.path.exists(path):
+                os.remove(path)
+            return None
+        return path
 
     def export_to_excel(self, filename: str = "elab_analytics_comprehensive.xlsx", days_back: int = 365):
         """
         Export all comprehensive analytics to Excel file with multiple sheets
+        The JSON sidecar is written section by section as each sheet is exported, and every table
+        is also saved as Parquet in a <name>_parquet directory; returns the KPIs, meta and the row count of each exported section
         """
-        print(f"\n{'='*70}")
-        print(f"Starting eLAB Comprehensive Analytics Export")
-        print(f"{'='*70}\n")
+        logger.info(f"\n{'='*70}")
+        logger.info(f"Starting eLAB Comprehensive Analytics Export")
+        logger.info(f"{'='*70}\n")
 
         start_date, end_date = self.get_date_range(days_back)
-        print(f"📅 Date range: {start_date[:10]} to {end_date[:10]}\n")
+        logger.info(f"📅 Date range: {start_date[:10]} to {end_date[:10]}\n")
 
         all_data = {}
 
-        with pd.ExcelWriter(filename, engine='openpyxl') as writer:
-
-            # 1. District Analysis (Fixed)
-            try:
-                print("1/11 Processing District Analysis...")
-                district_df = self.get_district_analysis_comprehensive(start_date, end_date)
-                if not district_df.empty:
-                    district_df.to_excel(writer, sheet_name='District Analysis', index=False)
-                    self.format_excel_sheet(writer.sheets['District Analysis'], district_df)
-                    all_data['district_analysis'] = district_df.to_dict('records')
-                    print(f"   ✓ District Analysis: {len(district_df)} rows exported")
-                else:
-                    print("   ⚠ District Analysis: No data found")
-            except Exception as e:
-                print(f"   ✗ District Analysis failed: {e}")
-
-            # 2. Monthly Employee Comparison
-            try:
-                print("2/11 Processing Monthly Employee Comparison...")
-                emp_monthly_comp_df = self.get_employee_monthly_comparison(start_date, end_date)
-                if not emp_monthly_comp_df.empty:
-                    emp_monthly_comp_df.to_excel(writer, sheet_name='Employee Monthly Comparison', index=False)
-                    self.format_excel_sheet(writer.sheets['Employee Monthly Comparison'], emp_monthly_comp_df)
-                    all_data['employee_monthly_comparison'] = emp_monthly_comp_df.to_dict('records')
-                    print(f"   ✓ Employee Monthly Comparison: {len(emp_monthly_comp_df)} rows exported")
-                else:
-                    print("   ⚠ Employee Monthly Comparison: No data found")
-            except Exception as e:
-                print(f"   ✗ Employee Monthly Comparison failed: {e}")
-
-            # 3. Monthly Cases by Employee
-            try:
-                print("3/11 Processing Monthly Cases by Employee...")
-                emp_monthly_cases_df = self.get_employee_monthly_cases(start_date, end_date)
-                if not emp_monthly_cases_df.empty:
-                    emp_monthly_cases_df.to_excel(writer, sheet_name='Employee Monthly Cases', index=False)
-                    self.format_excel_sheet(writer.sheets['Employee Monthly Cases'], emp_monthly_cases_df)
-                    all_data['employee_monthly_cases'] = emp_monthly_cases_df.to_dict('records')
-                    print(f"   ✓ Employee Monthly Cases: {len(emp_monthly_cases_df)} rows exported")
-                else:
-                    print("   ⚠ Employee Monthly Cases: No data found")
-            except Exception as e:
-                print(f"   ✗ Employee Monthly Cases failed: {e}")
-
-            # 4. Test Monthly Analysis
-            try:
-                print("4/11 Processing Test Monthly Analysis...")
-                test_monthly_df = self.get_test_monthly_analysis(start_date, end_date)
-                if not test_monthly_df.empty:
-                    test_monthly_df.to_excel(writer, sheet_name='Test Monthly Analysis', index=False)
-                    self.format_excel_sheet(writer.sheets['Test Monthly Analysis'], test_monthly_df)
-                    all_data['test_monthly_analysis'] = test_monthly_df.to_dict('records')
-                    print(f"   ✓ Test Monthly Analysis: {len(test_monthly_df)} rows exported")
-                else:
-                    print("   ⚠ Test Monthly Analysis: No data found")
-            except Exception as e:
-                print(f"   ✗ Test Monthly Analysis failed: {e}")
-
-            # 5. Test Employee-wise Analysis
-            try:
-                print("5/11 Processing Test Employee-wise Analysis...")
-                test_employee_df = self.get_test_employee_wise_analysis(start_date, end_date)
-                if not test_employee_df.empty:
-                    test_employee_df.to_excel(writer, sheet_name='Test Employee Analysis', index=False)
-                    self.format_excel_sheet(writer.sheets['Test Employee Analysis'], test_employee_df)
-                    all_data['test_employee_analysis'] = test_employee_df.to_dict('records')
-                    print(f"   ✓ Test Employee-wise Analysis: {len(test_employee_df)} rows exported")
-                else:
-                    print("   ⚠ Test Employee-wise Analysis: No data found")
-            except Exception as e:
-                print(f"   ✗ Test Employee-wise Analysis failed: {e}")
-
-            # 6. Most Tests by Employee
+        # Fetch shared tables once; every analysis below reuses these DataFrames. A table that fails to load
+        # only fails the analyses that read it, which re-raise its error from .result()
+        self.invalidate()
+        logger.info("⬇️ Prefetching users, visits and tests...")
+
+        def load_period_tests():
+            # Tests in the export window, filtered once and shared by every test analysis
+            tests_future.result()
+            return self._tests_in_range(start_date, end_date)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            users_future = executor.submit(self._load_users)
+            visits_future = executor.submit(self._load_visits, start_date, end_date)
+            tests_future = executor.submit(self._load_tests, start_date, end_date)
+            period_tests_future = executor.submit(load_period_tests)
+            for name, future in [('users', users_future), ('visits', visits_future), ('tests', tests_future)]:
+                try:
+                    logger.info(f"   Loaded {len(future.result())} {name}")
+                except Exception as e:
+                    logger.error(f"   ✗ Loading {name} failed: {e}")
+        logger.info("")
+
+        def most_tests():
+            # Reuse the employee-wise summary when it succeeded; otherwise recompute it
             try:
-                print("6/11 Processing Most Tests by Employee...")
-                most_tests_df = self.get_employee_most_tests(start_date, end_date)
-                if not most_tests_df.empty:
-                    most_tests_df.to_excel(writer, sheet_name='Employee Most Tests', index=False)
-                    self.format_excel_sheet(writer.sheets['Employee Most Tests'], most_tests_df)
-                    all_data['employee_most_tests'] = most_tests_df.to_dict('records')
-                    print(f"   ✓ Most Tests by Employee: {len(most_tests_df)} rows exported")
-                else:
-                    print("   ⚠ Most Tests by Employee: No data found")
-            except Exception as e:
-                print(f"   ✗ Most Tests by Employee failed: {e}")
-
-            # 7. District-wise Test Analysis
-            try:
-                print("7/11 Processing District-wise Test Analysis...")
-                district_test_df = self.get_district_test_analysis(start_date, end_date)
-                if not district_test_df.empty:
-                    district_test_df.to_excel(writer, sheet_name='District Test Analysis', index=False)
-                    self.format_excel_sheet(writer.sheets['District Test Analysis'], district_test_df)
-                    all_data['district_test_analysis'] = district_test_df.to_dict('records')
-                    print(f"   ✓ District-wise Test Analysis: {len(district_test_df)} rows exported")
-                else:
-                    print("   ⚠ District-wise Test Analysis: No data found")
-            except Exception as e:
-                print(f"   ✗ District-wise Test Analysis failed: {e}")
-
-            # 8. District-wise Test Monthly Analysis
-            try:
-                print("8/11 Processing District-wise Test Monthly Analysis...")
-                district_test_monthly_df = self.get_district_test_monthly_analysis(start_date, end_date)
-                if not district_test_monthly_df.empty:
-                    district_test_monthly_df.to_excel(writer, sheet_name='District Test Monthly', index=False)
-                    self.format_excel_sheet(writer.sheets['District Test Monthly'], district_test_monthly_df)
-                    all_data['district_test_monthly'] = district_test_monthly_df.to_dict('records')
-                    print(f"   ✓ District-wise Test Monthly: {len(district_test_monthly_df)} rows exported")
-                else:
-                    print("   ⚠ District-wise Test Monthly: No data found")
-            except Exception as e:
-                print(f"   ✗ District-wise Test Monthly failed: {e}")
-
-            # 9. District-wise Test Yearly Analysis
-            try:
-                print("9/11 Processing District-wise Test Yearly Analysis...")
-                district_test_yearly_df = self.get_district_test_yearly_analysis(start_date, end_date)
-                if not district_test_yearly_df.empty:
-                    district_test_yearly_df.to_excel(writer, sheet_name='District Test Yearly', index=False)
-                    self.format_excel_sheet(writer.sheets['District Test Yearly'], district_test_yearly_df)
-                    all_data['district_test_yearly'] = district_test_yearly_df.to_dict('records')
-                    print(f"   ✓ District-wise Test Yearly: {len(district_test_yearly_df)} rows exported")
-                else:
-                    print("   ⚠ District-wise Test Yearly: No data found")
-            except Exception as e:
-                print(f"   ✗ District-wise Test Yearly failed: {e}")
-
-            # 10. Species Analysis
-            try:
-                print("10/11 Processing Species Analysis...")
-                species_df = self.get_species_analysis(start_date, end_date)
-                if not species_df.empty:
-                    species_df.to_excel(writer, sheet_name='Species Analysis', index=False)
-                    self.format_excel_sheet(writer.sheets['Species Analysis'], species_df)
-                    all_data['species_analysis'] = species_df.to_dict('records')
-                    print(f"   ✓ Species Analysis: {len(species_df)} rows exported")
-                else:
-                    print("   ⚠ Species Analysis: No data found")
-            except Exception as e:
-                print(f"   ✗ Species Analysis failed: {e}")
-
-            # 11. Dashboard KPIs
-            try:
-                print("11/11 Processing Dashboard KPIs...")
-                kpis = self.get_dashboard_kpis(start_date, end_date)
-                kpis_df = pd.DataFrame([kpis]).T.reset_index()
-                kpis_df.columns = ['KPI', 'Value']
-                kpis_df.to_excel(writer, sheet_name='Dashboard KPIs', index=False)
-                self.format_excel_sheet(writer.sheets['Dashboard KPIs'], kpis_df)
-                all_data['dashboard_kpis'] = kpis
-                print(f"   ✓ Dashboard KPIs: {len(kpis_df)} metrics exported")
-            except Exception as e:
-                print(f"   ✗ Dashboard KPIs failed: {e}")
-
-        # Export to JSON
-        json_filename = filename.replace('.xlsx', '.json')
-        all_data['meta'] = {
-            'export_date': datetime.now().isoformat(),
-            'start_date': start_date,
-            'end_date': end_date,
-            'days_analyzed': days_back
-        }
+                employee_test_df = employee_future.result()
+            except Exception:
+                employee_test_df = None
+            return self.get_employee_most_tests(start_date, end_date, df=period_tests_future.result(),
+                                                employee_test_df=employee_test_df)
+
+        # (label, sheet name, JSON key, analysis) in sheet order
+        analyses = [
+            ('District Analysis', 'District Analysis', 'district_analysis',
+             lambda: self.get_district_analysis_comprehensive(start_date, end_date, df=visits_future.result())),
+            ('Employee Monthly Comparison', 'Employee Monthly Comparison', 'employee_monthly_comparison',
+             lambda: self.get_employee_monthly_comparison(start_date, end_date, df=visits_future.result())),
+            ('Employee Monthly Cases', 'Employee Monthly Cases', 'employee_monthly_cases',
+             lambda: self.get_employee_monthly_cases(start_date, end_date, df=visits_future.result())),
+            ('Test Monthly Analysis', 'Test Monthly Analysis', 'test_monthly_analysis',
+             lambda: self.get_test_monthly_analysis(start_date, end_date, df=period_tests_future.result())),
+            ('Test Employee-wise Analysis', 'Test Employee Analysis', 'test_employee_analysis',
+             lambda: self.get_test_employee_wise_analysis(start_date, end_date, df=period_tests_future.result())),
+            ('Most Tests by Employee', 'Employee Most Tests', 'employee_most_tests', most_tests),
+            ('District-wise Test Analysis', 'District Test Analysis', 'district_test_analysis',
+             lambda: self.get_district_test_analysis(start_date, end_date, df=period_tests_future.result())),
+            ('District-wise Test Monthly', 'District Test Monthly', 'district_test_monthly',
+             lambda: self.get_district_test_monthly_analysis(start_date, end_date, df=period_tests_future.result())),
+            ('District-wise Test Yearly', 'District Test Yearly', 'district_test_yearly',
+             lambda: self.get_district_test_yearly_analysis(start_date, end_date, df=period_tests_future.result())),
+            ('Species Analysis', 'Species Analysis', 'species_analysis',
+             lambda: self.get_species_analysis(start_date, end_date, df=visits_future.result())),
+            ('Dashboard KPIs', 'Dashboard KPIs', 'dashboard_kpis',
+             lambda: self.get_dashboard_kpis(start_date, end_date, df=visits_future.result(), users_df=users_future.result())),
+        ]
+        total = len(analyses)
+
+        # The analyses are independent, so run them concurrently and write the sheets in order
+        logger.info(f"⚙️ Running {total} analyses in parallel...\n")
+        executor = ThreadPoolExecutor(max_workers=total)
+        futures = {}
+        for _, _, key, analysis in analyses:
+            if key == 'dashboard_kpis':
+                futures[key] = executor.submit(analysis)
+            else:
+                futures[key] = executor.submit(self._cached_result, key, start_date, end_date, analysis)
+            if key == 'test_employee_analysis':
+                employee_future = futures[key]
+
+        # Stream rows to disk; cell values are plain data, so skip formula/URL detection on every string
+        excel_options = {'constant_memory': True, 'strings_to_formulas': False, 'strings_to_urls': False}
+        # Sibling outputs share the workbook's name whatever its extension's case
+        base_name = os.path.splitext(filename)[0]
+        json_filename = f"{base_name}.json"
+        parquet_dir = f"{base_name}_parquet"
+        try:
+            os.makedirs(parquet_dir, exist_ok=True)
+            # Drop the previous run's tables, so a section that is empty or fails this run leaves no stale file
+            for _, _, key, _ in analyses:
+                path = os.path.join(parquet_dir, f"{key}.parquet")
+                if os.path.exists(path):
+                    os.remove(path)
+        except OSError as e:
+            # The Parquet tables are optional; the workbook and JSON are still written
+            logger.warning(f"⚠ Skipping Parquet output, could not prepare {parquet_dir}: {e}")
+            parquet_dir = None
+        # The zip container is assembled in memory and written to disk in one go
+        excel_buffer = io.BytesIO()
+        with executor, pd.ExcelWriter(excel_buffer, engine='xlsxwriter', engine_kwargs={'options': excel_options}) as writer, \
+                open(json_filename, 'w') as json_file:
+            formats = self.create_excel_formats(writer.book)
+            json_file.write('{')
+            # Set once a section is in the JSON file, so later members know to start with a comma
+            json_sections_written = False
+            for number, (label, sheet_name, key, _) in enumerate(analyses, 1):
+                try:
+                    logger.info(f"{number}/{total} Processing {label}...")
+                    # Popped so each result is released once its sheet and JSON section are written
+                    result = futures.pop(key).result()
+
+                    # Parquet is written last and never raises, so it cannot cost a section its sheet or JSON member
+                    if key == 'dashboard_kpis':
+                        kpis_df = pd.DataFrame({'KPI': list(result), 'Value': list(result.values())})
+                        rows = self.write_excel_sheet(writer, sheet_name, kpis_df, formats)
+                        self.write_json_section(json_file, key, result, first=not json_sections_written)
+                        json_sections_written = True
+                        self.write_parquet_section(parquet_dir, key, kpis_df)
+                        all_data[key] = result
+                        logger.info(f"   ✓ {label}: {rows} metrics exported")
+                    elif len(result.index):
+                        rows = self.write_excel_sheet(writer, sheet_name, result, formats)
+                        self.write_json_section(json_file, key, result, first=not json_sections_written)
+                        json_sections_written = True
+                        self.write_parquet_section(parquet_dir, key, result)
+                        all_data[key] = rows
+                        logger.info(f"   ✓ {label}: {rows} rows exported")
+                    else:
+                        logger.warning(f"   ⚠ {label}: No data found")
+                except Exception as e:
+                    logger.error(f"   ✗ {label} failed: {e}")
+
+            # Close the JSON object with the export metadata
+            all_data['meta'] = {
+                'export_date': datetime.now().isoformat(),
+                'start_date': start_date,
+                'end_date': end_date,
+                'days_analyzed': days_back
+            }
+            self.write_json_section(json_file, 'meta', all_data['meta'], first=not json_sections_written)
+            json_file.write('\n}\n')
+
+        with open(filename, 'wb') as f:
+            f.write(excel_buffer.getbuffer())
+
+        logger.info(f"\n{'='*70}")
+        logger.info(f"✓ Export completed successfully!")
+        logger.info(f"📁 Excel file saved: {filename}")
+        logger.info(f"📁 JSON file saved: {json_filename}")
+        if parquet_dir:
+            logger.info(f"📁 Parquet tables saved: {parquet_dir}/")
+        logger.info(f"{'='*70}\n")
 
-        with open(json_filename, 'w') as f:
-            json.dump(all_data, f, indent=2, default=str)
+        return all_data
 
-        print(f"\n{'='*70}")
-        print(f"✓ Export completed successfully!")
-        print(f"📁 Excel file saved: {filename}")
-        print(f"📁 JSON file saved: {json_filename}")
-        print(f"{'='*70}\n")
 
-        return all_data
+def configure_logging() -> MemoryHandler:
+    """Send progress messages to stdout in batches of 100 (errors flush immediately)"""
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter('%(message)s'))
+    buffered = MemoryHandler(capacity=100, flushLevel=logging.ERROR, target=console)
+    logger.addHandler(buffered)
+    logger.setLevel(logging.INFO)
+    return buffered
 
 
 def main():
     """Main execution function"""
-    print("\n" + "="*70)
-    print("eLAB Comprehensive Analytics Data Exporter v2.0")
-    print("="*70 + "\n")
+    log_buffer = configure_logging()
+    logger.info("\n" + "="*70)
+    logger.info("eLAB Comprehensive Analytics Data Exporter v2.0")
+    logger.info("="*70 + "\n")
 
     try:
-        exporter = eLABAnalyticsComprehensive()
+        # --refresh skips the Parquet cache and re-fetches everything from Supabase
+        exporter = eLABAnalyticsComprehensive(refresh='--refresh' in sys.argv[1:])
 
-        # You can customize these parameters
+        # You can customize these parameters (show buffered messages before prompting)
+        log_buffer.flush()
         days_back = int(input("Enter number of days to analyze (default 365): ") or 365)
         filename = input("Enter output filename (default 'elab_analytics_comprehensive.xlsx'): ") or "elab_analytics_comprehensive.xlsx"
 
@@ -879,15 +1129,15 @@ def main():
 
         exporter.export_to_excel(filename=filename, days_back=days_back)
 
-        print("\n✓ All comprehensive analytics have been exported successfully!")
-        print(f"✓ You can now open '{filename}' to view the data")
-        print(f"✓ JSON data available in '{filename.replace('.xlsx', '.json')}'")
+        logger.info("\n✓ All comprehensive analytics have been exported successfully!")
+        logger.info(f"✓ You can now open '{filename}' to view the data")
+        logger.info(f"✓ JSON data available in '{os.path.splitext(filename)[0]}.json'")
 
     except Exception as e:
-        print(f"\n✗ Error: {e}")
-        import traceback
-        traceback.print_exc()
-        print("Please check your .env file and ensure SUPABASE_URL and SUPABASE_KEY are set correctly")
+        logger.exception(f"\n✗ Error: {e}")
+        logger.error("Please check your .env file and ensure SUPABASE_URL and SUPABASE_KEY are set correctly")
+    finally:
+        log_buffer.flush()
 
 
 if __name__ == "__main__":